@@ -0,0 +1,170 @@
+"""
+Verify SC2Bank files inside zip and tar archives without extracting them.
+
+Each member's identity is derived from its path inside the archive, e.g.
+Accounts/12345678/1-S2-1-4253458/Banks/1-S2-1-4337146/llIlIIlIlIllIllI.SC2Bank
+in a backup of a whole Accounts tree. The archive is read once from start to
+end. Parsing and hashing can be handed to a process pool, in which case
+only a bounded number of members are held in memory at once.
+
+Tar archives may be uncompressed or compressed with gzip, bzip2 or xz.
+Reading .zst archives requires the optional zstandard package.
+"""
+
+from collections import deque
+import multiprocessing
+import os
+import re
+import tarfile
+import zipfile
+from io import BytesIO
+from .sc2bank import verify_bank
+
+
+SC2BANK_MEMBER = re.compile(r'\.SC2Bank$', re.I)
+
+
+def member_path(name):
+    """Convert an archive member's name to a path for inspect_path()."""
+    return name.replace('/', os.sep)
+
+
+def _zstd_reader(f):
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError('Reading .zst archives requires the zstandard '
+                           'package.')
+    return zstandard.ZstdDecompressor().stream_reader(f)
+
+
+def read_errors():
+    """Exceptions raised while reading a damaged archive."""
+    errors = (IOError, EOFError, tarfile.TarError, zipfile.BadZipfile)
+    try:
+        import zstandard
+    except ImportError:
+        return errors
+    return errors + (zstandard.ZstdError,)
+
+
+class _Unreadable(object):
+    """Stands in for a member that cannot be opened; reading re-raises."""
+
+    def __init__(self, error):
+        self.error = error
+
+    def read(self, size=-1):
+        raise self.error
+
+
+def _tar_members(tar):
+    for info in tar:
+        if info.isfile() and SC2BANK_MEMBER.search(info.name):
+            yield member_path(info.name), tar.extractfile(info)
+
+
+def _zip_members(archive):
+    # Visit members in the order they are stored, so the file is read
+    # sequentially.
+    infos = sorted(archive.infolist(), key=lambda i: i.header_offset)
+    for info in infos:
+        if info.filename.endswith('/') or \
+                not SC2BANK_MEMBER.search(info.filename):
+            continue
+        try:
+            member = archive.open(info)
+        except Exception as e:
+            # E.g. a damaged local header; fail this member only.
+            member = _Unreadable(e)
+        yield member_path(info.filename), member
+
+
+def iter_members(fname):
+    """
+    Iterate over the SC2Bank members of an archive in storage order.
+
+    fname -- Path to a zip, tar, tar.gz, tar.bz2, tar.xz, or tar.zst file
+
+    Yields:
+    Tuples of the member's path and a file object streaming its contents.
+    Each file object is only valid until the next member is requested.
+    Reading a member that cannot be opened raises its error.
+    """
+    if zipfile.is_zipfile(fname):
+        archive = zipfile.ZipFile(fname)
+        try:
+            for member in _zip_members(archive):
+                yield member
+        finally:
+            archive.close()
+        return
+    with open(fname, 'rb') as f:
+        if fname.lower().endswith(('.zst', '.tzst')):
+            tar = tarfile.open(fileobj=_zstd_reader(f), mode='r|')
+        else:
+            tar = tarfile.open(fileobj=f, mode='r|*')
+        try:
+            for member in _tar_members(tar):
+                yield member
+        finally:
+            tar.close()
+
+
+def _read_members(fname):
+    """Members' paths with their contents or the error reading them."""
+    for path, member in iter_members(fname):
+        try:
+            data, error = member.read(), None
+        except Exception as e:
+            data, error = None, '{0}: {1}'.format(type(e).__name__, e)
+        yield path, data, error
+
+
+def _verify_task(task):
+    path, data, error = task
+    if error is not None:
+        return {'path': path, 'signature': None, 'recorded': None,
+                'ok': False, 'error': error}
+    return verify_bank(path, BytesIO(data))
+
+
+def _bounded_imap(pool, func, iterable, window):
+    """Like pool.imap, but consume at most window items ahead of results."""
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def verify_archive(fname, processes=1, window=None):
+    """
+    Verify every SC2Bank member of an archive.
+
+    fname     -- Path to the archive, see iter_members()
+    processes -- Number of parse and hash processes. With 1 every member
+                 is parsed straight from the archive's stream. (default 1)
+    window    -- Maximum number of members read ahead of the workers
+                 (default 64 per process)
+
+    Yields:
+    Result dictionaries in archive order, see sc2bank.verify_bank().
+    """
+    if processes == 1:
+        for path, member in iter_members(fname):
+            yield verify_bank(path, member)
+        return
+    pool = multiprocessing.Pool(processes)
+    if window is None:
+        window = 64 * (processes or multiprocessing.cpu_count())
+    try:
+        tasks = _read_members(fname)
+        for result in _bounded_imap(pool, _verify_task, tasks, window):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
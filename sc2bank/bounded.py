@@ -0,0 +1,150 @@
+"""
+Sign SC2Bank files that do not fit in memory.
+
+sc2bank.sign() sorts every Section and Key of a bank in memory.
+sign_file() here streams them from the parser instead: records are
+collected until a memory budget is reached, and each sorted run is
+spilled to a temporary file. Runs are merged in tiers while parsing, so
+each record is rewritten only a logarithmic number of times. The runs
+left are then merged straight into the SHA-1, giving the same signature
+as sc2bank.sign().
+
+Sections and Keys are ordered by name exactly like sorted() orders them:
+records with equal names keep their document order, and each Section's
+Keys stay with it.
+"""
+
+import hashlib
+import heapq
+import json
+import tempfile
+from . import sc2bank
+
+
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+DEFAULT_MAX_RUNS = 64
+
+# Approximate size of a record's tuple and string objects, excluding the
+# strings' characters.
+RECORD_OVERHEAD = 400
+
+# Records are tuples of (section name, section index, kind, key name,
+# key index, value type, value), where kind orders a Section's own record
+# before its Keys'.
+_SECTION, _KEY = 0, 1
+
+
+class _RunWriter(sc2bank.BankParser):
+    """Split a bank's records into sorted runs within a memory budget."""
+
+    def __init__(self, memory_budget, max_runs, tmpdir):
+        super(_RunWriter, self).__init__()
+        self.memory_budget = memory_budget
+        self.max_runs = max_runs
+        self.tmpdir = tmpdir
+        self.records = []
+        self.size = 0
+        self.runs = []  # (level, file) tuples, levels never increasing
+        self.section_name = None
+        self.sections = 0
+        self.keys = 0
+
+    def begin_section(self, name):
+        self.section_name = name
+        self.sections += 1
+        self.append((name, self.sections, _SECTION, '', 0, '', ''))
+
+    def add_key(self, key):
+        self.keys += 1
+        self.append((self.section_name, self.sections, _KEY, key.name,
+                     self.keys, key.type, key.value))
+
+    def append(self, record):
+        self.records.append(record)
+        section_name, _, _, key_name, _, key_type, value = record
+        self.size += RECORD_OVERHEAD + len(section_name) + len(key_name) + \
+            len(key_type) + len(value)
+        if self.size >= self.memory_budget:
+            self.spill()
+
+    def spill(self):
+        self.records.sort()
+        self.runs.append((0, self.write_run(self.records)))
+        self.records, self.size = [], 0
+        # Once the newest runs fill a level, merge them into one run of
+        # the next level. This keeps the number of open files small
+        # without rewriting the largest runs on every merge.
+        fan_in = max(2, self.max_runs - 1)
+        while len(self.runs) >= fan_in and \
+                self.runs[-fan_in][0] == self.runs[-1][0]:
+            level = self.runs[-1][0]
+            runs = [run for _, run in self.runs[-fan_in:]]
+            del self.runs[-fan_in:]
+            self.runs.append((level + 1, self.write_run(merge(runs))))
+
+    def write_run(self, records):
+        run = tempfile.TemporaryFile(mode='w+', dir=self.tmpdir)
+        for record in records:
+            run.write(json.dumps(record) + '\n')
+        run.seek(0)
+        return run
+
+    def sorted_records(self):
+        """Merge the spilled runs and the records still in memory."""
+        self.records.sort()
+        if not self.runs:
+            return iter(self.records)
+        return merge([run for _, run in self.runs], self.records)
+
+
+def _read_run(run):
+    try:
+        for line in run:
+            yield tuple(json.loads(line))
+    finally:
+        run.close()
+
+
+def merge(runs, records=()):
+    """Merge sorted run files and sorted in-memory records."""
+    return heapq.merge(records, *[_read_run(run) for run in runs])
+
+
+def sign_file(fname, author_id=None, user_id=None, name=None, path=None,
+              memory_budget=DEFAULT_MEMORY_BUDGET, max_runs=DEFAULT_MAX_RUNS,
+              tmpdir=None):
+    """
+    Sign a SC2Bank file within a memory budget.
+
+    memory_budget -- Approximate number of bytes of Sections and Keys to
+                     hold in memory before spilling them to a run
+    max_runs      -- Bound on the runs merged at once while parsing:
+                     max_runs - 1 runs of the same level are merged into
+                     one run of the next level
+    tmpdir        -- Directory for the runs (default tempfile's default)
+
+    See sc2bank.sign_file() for the remaining arguments.
+
+    Returns:
+    Tuple of the calculated signature and the signature recorded in
+    the XML document.
+    """
+    author_id, user_id, name = sc2bank.identity(
+        fname if path is None else path, author_id, user_id, name)
+    writer = _RunWriter(memory_budget, max_runs, tmpdir)
+    if hasattr(fname, 'read'):
+        writer.parse(fname)
+    else:
+        with open(fname, 'rb') as f:
+            writer.parse(f)
+
+    h = hashlib.sha1()
+    h.update(''.join([author_id, user_id, name]).encode('UTF-8'))
+    for section_name, _, kind, key_name, _, key_type, value in \
+            writer.sorted_records():
+        if kind == _SECTION:
+            h.update(section_name.encode('UTF-8'))
+        else:
+            h.update(''.join([key_name, 'Value', key_type, value])
+                     .encode('UTF-8'))
+    return h.hexdigest().upper(), writer.signature
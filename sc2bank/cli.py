@@ -1,11 +1,17 @@
 from __future__ import print_function
+# Only modules the verify path needs are imported up front. argparse and
+# the batch command modules are imported where they are used, so
+# verifying a single SC2Bank starts quickly.
 import os
-from . import sc2bank
 import sys
-import argparse
 
 
-def parse_args(args):
+COMMANDS = ('plan', 'worker', 'merge', 'resign', 'archive',
+            'recover')
+
+
+def build_parser():
+    import argparse
     parser = argparse.ArgumentParser(description='Verify a SC2Bank signature.')
     parser.add_argument('--userid',
                         '-u',
@@ -20,41 +26,374 @@ def parse_args(args):
                         default=None,
                         help='SC2Bank name to verify with (is usually the '
                              'filename without the extension)')
+    parser.add_argument('--memory-budget',
+                        '-m',
+                        type=parse_size,
+                        default=None,
+                        help='Sign large SC2Banks using about this much '
+                             'memory, spilling to temporary files, e.g. '
+                             '512M')
     parser.add_argument('sc2bank',
                         metavar='SC2BANK',
                         help='Path of the SC2Bank to verify')
+    return parser
+
+
+def parse_args(args):
+    parser = build_parser()
     return parser.parse_args(args), parser
 
 
+def parse_size(size):
+    """Parse a number of bytes with an optional K, M, or G suffix."""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    multiplier = units.get(size[-1:].upper(), 1)
+    digits = size[:-1] if multiplier != 1 else size
+    if not digits.isdigit() or int(digits) == 0:
+        raise ValueError('Invalid size: ' + size)
+    return int(digits) * multiplier
+
+
+def parse_command_args(args):
+    import argparse
+    from . import distributed, resign
+    parser = argparse.ArgumentParser(
+        prog='sc2bank',
+        description='Verify and sign many SC2Banks at once.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    plan = subparsers.add_parser('plan',
+                                 help='Split a bank list into shards')
+    plan.add_argument('workdir',
+                      metavar='WORKDIR',
+                      help='Work directory shared by the workers')
+    plan.add_argument('banks',
+                      metavar='LIST',
+                      help='File with one SC2Bank path per line, or - for '
+                           'stdin')
+    plan.add_argument('--shard-size',
+                      '-s',
+                      type=int,
+                      default=distributed.DEFAULT_SHARD_SIZE,
+                      help='Maximum number of SC2Banks per shard')
+    plan.set_defaults(func=plan_main)
+
+    worker = subparsers.add_parser('worker',
+                                   help='Verify shards until all are done')
+    worker.add_argument('workdir',
+                        metavar='WORKDIR',
+                        help='Work directory shared by the workers')
+    worker.add_argument('--worker-id',
+                        default=None,
+                        help='Name recorded in leases (default is the '
+                             'host name and process ID)')
+    worker.add_argument('--lease-timeout',
+                        type=float,
+                        default=distributed.DEFAULT_LEASE_TIMEOUT,
+                        help='Seconds without a heartbeat before a '
+                             'lease is taken over')
+    worker.set_defaults(func=worker_main)
+
+    merge = subparsers.add_parser('merge',
+                                  help='Combine the results of all shards')
+    merge.add_argument('workdir',
+                       metavar='WORKDIR',
+                       help='Work directory shared by the workers')
+    merge.add_argument('--output',
+                       '-o',
+                       default=None,
+                       help='Write the merged results to this file as '
+                            'JSON lines')
+    merge.set_defaults(func=merge_main)
+
+    resign_ = subparsers.add_parser('resign',
+                                    help='Rewrite the signatures of many '
+                                         'SC2Banks')
+    resign_.add_argument('banks',
+                         metavar='LIST',
+                         nargs='?',
+                         default=None,
+                         help='File with one SC2Bank path per line, or - for '
+                              'stdin (not needed with --resume or '
+                              '--rollback)')
+    resign_.add_argument('--journal',
+                         '-j',
+                         required=True,
+                         help='Journal recording the run')
+    resign_.add_argument('--userid',
+                         '-u',
+                         default=None,
+                         help='User ID to sign the SC2Banks with')
+    resign_.add_argument('--authorid',
+                         '-a',
+                         default=None,
+                         help='Author ID to sign the SC2Banks with')
+    action = resign_.add_mutually_exclusive_group()
+    action.add_argument('--resume',
+                        action='store_true',
+                        help='Continue the interrupted run in the journal')
+    action.add_argument('--rollback',
+                        action='store_true',
+                        help='Restore the old signatures of the run in the '
+                             'journal')
+    resign_.add_argument('--processes',
+                         type=int,
+                         default=None,
+                         help='Number of signing processes (default is the '
+                              'number of CPUs)')
+    resign_.add_argument('--io-threads',
+                         type=int,
+                         default=resign.DEFAULT_IO_THREADS,
+                         help='Number of threads rewriting files')
+    resign_.set_defaults(func=resign_main)
+
+    archive_ = subparsers.add_parser('archive',
+                                     help='Verify the SC2Banks inside a zip '
+                                          'or tar archive')
+    archive_.add_argument('archive',
+                          metavar='ARCHIVE',
+                          help='Path of a zip, tar, tar.gz, tar.bz2, tar.xz, '
+                               'or tar.zst archive')
+    archive_.add_argument('--processes',
+                          type=int,
+                          default=None,
+                          help='Number of parse and hash processes (default '
+                               'is the number of CPUs)')
+    archive_.add_argument('--output',
+                          '-o',
+                          default=None,
+                          help='Write the results to this file as JSON lines')
+    archive_.set_defaults(func=archive_main)
+
+    recover_ = subparsers.add_parser('recover',
+                                     help='Search for the Author ID, User ID '
+                                          'and name of a SC2Bank')
+    recover_.add_argument('sc2bank',
+                          metavar='SC2BANK',
+                          help='Path of the SC2Bank to recover')
+    recover_.add_argument('--ids',
+                          action='append',
+                          default=[],
+                          help='File with one candidate ID per line')
+    recover_.add_argument('--tree',
+                          action='append',
+                          default=[],
+                          help='Directory whose subdirectories are named '
+                               'after candidate IDs, e.g. an Accounts '
+                               'folder')
+    recover_.add_argument('--range',
+                          action='append',
+                          default=[],
+                          help='Candidate ID range, e.g. '
+                               '1-S2-1-4337000:4338000')
+    recover_.add_argument('--userid',
+                          '-u',
+                          default=None,
+                          help='Known User ID')
+    recover_.add_argument('--authorid',
+                          '-a',
+                          default=None,
+                          help='Known Author ID')
+    recover_.add_argument('--bankname',
+                          '-b',
+                          action='append',
+                          default=[],
+                          help='Candidate SC2Bank name (default is the '
+                               'filename without the extension)')
+    recover_.add_argument('--processes',
+                          type=int,
+                          default=None,
+                          help='Number of search processes (default is the '
+                               'number of CPUs)')
+    recover_.set_defaults(func=recover_main)
+    return parser.parse_args(args), parser
+
+
+def read_bank_list(fname):
+    if fname == '-':
+        return [line.rstrip('\n') for line in sys.stdin if line.strip()]
+    with open(fname, 'r') as f:
+        return [line.rstrip('\n') for line in f if line.strip()]
+
+
+def plan_main(args):
+    from . import distributed
+    paths = read_bank_list(args.banks)
+    count = distributed.plan(args.workdir, paths, args.shard_size)
+    print('Planned {0} SC2Banks in {1} shards.'.format(len(paths), count))
+
+
+def worker_main(args):
+    from . import distributed
+    try:
+        done = distributed.work(args.workdir,
+                                worker_id=args.worker_id,
+                                timeout=args.lease_timeout)
+    except RuntimeError as e:
+        sys.stderr.write('Error: {0}\n'.format(e))
+        sys.exit(2)
+    print('Completed {0} shards.'.format(len(done)))
+
+
+def merge_main(args):
+    from . import distributed
+    try:
+        results = distributed.merge(args.workdir)
+    except RuntimeError as e:
+        sys.stderr.write('Error: {0}\n'.format(e))
+        sys.exit(2)
+    report_results(results, args.output)
+
+
+def archive_main(args):
+    from . import archive
+    try:
+        report_results(archive.verify_archive(args.archive,
+                                              processes=args.processes),
+                       args.output)
+    except (RuntimeError,) + archive.read_errors() as e:
+        sys.stderr.write('Error: {0}\n'.format(e))
+        sys.exit(2)
+
+
+def recover_main(args):
+    from . import recover
+    candidates = set()
+    try:
+        for fname in args.ids:
+            candidates.update(recover.ids_from_file(fname))
+        for root in args.tree:
+            candidates.update(recover.ids_from_tree(root))
+        for spec in args.range:
+            candidates.update(recover.id_range(spec))
+    except (ValueError, IOError) as e:
+        sys.stderr.write('Error: {0}\n'.format(e))
+        sys.exit(2)
+    candidates = sorted(candidates)
+    author_ids = [args.authorid] if args.authorid else candidates
+    user_ids = [args.userid] if args.userid else candidates
+    if not (author_ids and user_ids):
+        sys.stderr.write('Error: Must specify candidate IDs with --ids, '
+                         '--tree, or --range.\n')
+        sys.exit(2)
+    try:
+        found = recover.recover_file(args.sc2bank, author_ids, user_ids,
+                                     names=args.bankname,
+                                     processes=args.processes)
+    except (RuntimeError, IOError, SyntaxError) as e:
+        # ElementTree's ParseError is a SyntaxError.
+        sys.stderr.write('Error: {0}\n'.format(e))
+        sys.exit(2)
+    if found is None:
+        print('No candidate reproduces the recorded signature.')
+        sys.exit(1)
+    print('Author ID: {0}'.format(found.author_id))
+    print('User ID:   {0}'.format(found.user_id))
+    print('Bank name: {0}'.format(found.name))
+
+
+def report_results(results, output=None):
+    """Print failed verification results and exit 1 if there were any."""
+    import json
+    out = open(output, 'w') if output is not None else None
+    count, bad = 0, 0
+    try:
+        for result in results:
+            count += 1
+            if out is not None:
+                out.write(json.dumps(result, sort_keys=True) + '\n')
+            if not result['ok']:
+                bad += 1
+                print('{0}: {1}'.format(result['path'],
+                                        result['error'] or
+                                        'Signatures are NOT equal!'))
+    finally:
+        if out is not None:
+            out.close()
+    print('Verified {0} SC2Banks, {1} failed.'.format(count, bad))
+    if bad:
+        sys.exit(1)
+
+
+def resign_main(args):
+    from . import resign
+    failed = {}
+    try:
+        if args.rollback:
+            count, failed = resign.rollback(args.journal,
+                                            io_threads=args.io_threads)
+        elif args.resume:
+            count, failed = resign.resume(args.journal,
+                                          processes=args.processes,
+                                          io_threads=args.io_threads)
+        elif args.banks is None:
+            sys.stderr.write('Error: Must specify a SC2Bank list, --resume, '
+                             'or --rollback.\n')
+            sys.exit(2)
+        else:
+            count, failed = resign.resign(read_bank_list(args.banks),
+                                          args.journal,
+                                          author_id=args.authorid,
+                                          user_id=args.userid,
+                                          processes=args.processes,
+                                          io_threads=args.io_threads)
+    except (RuntimeError, IOError) as e:
+        sys.stderr.write('Error: {0}\n'.format(e))
+        sys.exit(2)
+    for path, error in sorted(failed.items()):
+        print('{0}: {1}'.format(path, error))
+    print('Rewrote {0} SC2Banks, {1} failed.'.format(count, len(failed)))
+    if failed:
+        sys.exit(1)
+
+
 def main(args):
-    args, parser = parse_args(args)
+    if args and args[0] in COMMANDS:
+        args, _ = parse_command_args(args)
+        args.func(args)
+        return
+
+    if len(args) == 1 and not args[0].startswith('-'):
+        # Fast path for the common case of a single SC2Bank path.
+        verify(args[0])
+        return
+
+    args, _ = parse_args(args)
+    verify(args.sc2bank, args.authorid, args.userid, args.bankname,
+           args.memory_budget)
+
 
-    fname = args.sc2bank
-    author_id, user_id, bank_name = args.authorid, args.userid, args.bankname
+def usage_error(message):
+    sys.stderr.write('Error: {0}\n\n'.format(message))
+    build_parser().print_help()
+    sys.exit(2)
+
+
+def verify(fname, author_id=None, user_id=None, bank_name=None,
+           memory_budget=None):
+    from . import sc2bank
+
+    if memory_budget is not None:
+        from functools import partial
+        from . import bounded
+        sign_file = partial(bounded.sign_file, memory_budget=memory_budget)
+    else:
+        sign_file = sc2bank.sign_file
 
     if fname == '-':
         if None in (author_id, user_id, bank_name):
-            sys.stderr.write('Error: Must specify --userid, --authorid, and '
-                             '--bankname to sign SC2Bank from stdin.\n\n')
-            parser.print_help()
-            sys.exit(2)
-        signature, recorded_signature = sc2bank.sign_string(
-            sys.stdin.read(),
-            author_id=args.authorid,
-            user_id=args.userid,
-            name=args.bankname
-        )
+            usage_error('Must specify --userid, --authorid, and --bankname '
+                        'to sign SC2Bank from stdin.')
+        source = sys.stdin
     elif os.path.isfile(fname):
-        signature, recorded_signature = sc2bank.sign_file(
-            fname,
-            author_id=args.authorid,
-            user_id=args.userid,
-            name=args.bankname
-        )
+        source = fname
     else:
-        sys.stderr.write('Error: "{0}" is not a file.\n\n'.format(fname))
-        parser.print_help()
-        sys.exit(2)
+        usage_error('"{0}" is not a file.'.format(fname))
+
+    signature, recorded_signature = sign_file(source,
+                                              author_id=author_id,
+                                              user_id=user_id,
+                                              name=bank_name)
 
     print('Calculated signature: {0}'.format(signature))
     print('Recorded signature:   {0}'
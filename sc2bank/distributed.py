@@ -0,0 +1,344 @@
+"""
+Distribute batch SC2Bank verification across several worker processes.
+
+Workers share a work directory (for example on NFS) and do not need a
+coordinator. plan() splits the bank list into shard files. Each worker
+claims a shard by atomically creating a lease file, keeps the lease alive
+with a heartbeat while it verifies the shard's banks, and writes the
+shard's results before it moves on. A lease whose modification time has
+not changed for longer than the lease timeout, as measured by the
+observing worker's own clock, is considered abandoned and is taken over
+by another worker. Comparing the lease's mtime with the local clock is
+avoided on purpose: on NFS the mtime comes from the server, whose clock
+may be skewed. merge() combines the per-shard results.
+
+Work directory layout:
+
+WORKDIR/shards/0000.list  -- bank paths, one per line, published at once
+WORKDIR/leases/0000.2     -- lease on shard 0000, generation 2
+WORKDIR/results/0000.json -- one JSON object per verified bank
+"""
+
+import errno
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+from . import sc2bank
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SHARD_SIZE = 500
+DEFAULT_LEASE_TIMEOUT = 60.0
+
+SHARDS_DIR = 'shards'
+LEASES_DIR = 'leases'
+RESULTS_DIR = 'results'
+SHARD_SUFFIX = '.list'
+RESULT_SUFFIX = '.json'
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _write_atomic(path, data):
+    """Write data to path through a temporary file and a rename."""
+    tmp = '{0}.tmp.{1}.{2}'.format(path, socket.gethostname(), os.getpid())
+    with open(tmp, 'w') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp, path)
+
+
+def default_worker_id():
+    """Worker ID unique across the nodes sharing a work directory."""
+    return '{0}-{1}'.format(socket.gethostname(), os.getpid())
+
+
+def plan(workdir, paths, shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Split a bank list into shards inside a new work directory.
+
+    workdir    -- Work directory shared by the workers
+    paths      -- Iterable of SC2Bank paths
+    shard_size -- Maximum number of banks per shard
+
+    Returns:
+    Number of shards written.
+    """
+    if shard_size < 1:
+        raise ValueError('Shard size must be positive.')
+    shards_dir = os.path.join(workdir, SHARDS_DIR)
+    if os.path.isdir(shards_dir) and os.listdir(shards_dir):
+        raise RuntimeError('Work directory is already planned: ' + workdir)
+    for d in (LEASES_DIR, RESULTS_DIR):
+        _makedirs(os.path.join(workdir, d))
+    # Write the shards elsewhere and rename the directory into place, so
+    # a worker started while planning finds no shards instead of only
+    # some of them.
+    tmp = '{0}.tmp.{1}.{2}'.format(shards_dir, socket.gethostname(),
+                                   os.getpid())
+    _makedirs(tmp)
+    count, shard = 0, []
+
+    def flush():
+        name = '{0:04d}{1}'.format(count, SHARD_SUFFIX)
+        _write_atomic(os.path.join(tmp, name),
+                      ''.join(p + '\n' for p in shard))
+
+    try:
+        for path in paths:
+            shard.append(path)
+            if len(shard) == shard_size:
+                flush()
+                count, shard = count + 1, []
+        if shard:
+            flush()
+            count += 1
+        os.rename(tmp, shards_dir)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if os.path.isdir(shards_dir) and os.listdir(shards_dir):
+            # Another plan() finished first.
+            raise RuntimeError('Work directory is already planned: ' +
+                               workdir)
+        raise
+    return count
+
+
+def shard_ids(workdir):
+    """Sorted IDs of the shards planned in workdir."""
+    shards_dir = os.path.join(workdir, SHARDS_DIR)
+    if not os.path.isdir(shards_dir):
+        raise RuntimeError('Work directory is not planned: ' + workdir)
+    return sorted(n[:-len(SHARD_SUFFIX)]
+                  for n in os.listdir(shards_dir)
+                  if n.endswith(SHARD_SUFFIX))
+
+
+def read_shard(workdir, shard):
+    """List of bank paths in a shard."""
+    path = os.path.join(workdir, SHARDS_DIR, shard + SHARD_SUFFIX)
+    with open(path, 'r') as f:
+        return [line.rstrip('\n') for line in f if line.strip()]
+
+
+def result_path(workdir, shard):
+    return os.path.join(workdir, RESULTS_DIR, shard + RESULT_SUFFIX)
+
+
+def _lease_generations(workdir):
+    """Map each leased shard to its highest lease generation."""
+    generations = {}
+    for n in os.listdir(os.path.join(workdir, LEASES_DIR)):
+        shard, _, gen = n.partition('.')
+        if not gen.isdigit():
+            continue
+        generations[shard] = max(int(gen), generations.get(shard, -1))
+    return generations
+
+
+class Lease(object):
+    """Claim on a shard, kept alive by a heartbeat thread."""
+
+    def __init__(self, workdir, shard, generation, worker_id, timeout):
+        """
+        workdir    -- Work directory shared by the workers
+        shard      -- ID of the leased shard
+        generation -- Lease generation, incremented on every takeover
+        worker_id  -- ID of the worker holding the lease
+        timeout    -- Seconds without a heartbeat before the lease expires
+        """
+        self.workdir = workdir
+        self.shard = shard
+        self.generation = generation
+        self.worker_id = worker_id
+        self.timeout = timeout
+        self.path = os.path.join(workdir, LEASES_DIR,
+                                 '{0}.{1}'.format(shard, generation))
+        self._stop = threading.Event()
+        self._thread = None
+
+    def acquire(self):
+        """
+        Atomically create the lease file.
+
+        Returns:
+        True if this worker now holds the lease, False if another worker
+        created this generation first.
+        """
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as e:
+            if e.errno == errno.EEXIST:
+                return False
+            raise
+        try:
+            os.write(fd, self.worker_id.encode('UTF-8'))
+        finally:
+            os.close(fd)
+        self._thread = threading.Thread(target=self._heartbeat)
+        self._thread.daemon = True
+        self._thread.start()
+        return True
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.timeout / 3.0):
+            try:
+                os.utime(self.path, None)
+            except OSError as e:
+                # Keep trying; a transient NFS error must not let the
+                # lease expire while the shard is still being verified.
+                log.warning('Heartbeat on %s failed: %s', self.path, e)
+
+    def held(self):
+        """True unless another worker has taken over the shard."""
+        generation = _lease_generations(self.workdir).get(self.shard)
+        return generation == self.generation
+
+    def release(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def claim(workdir, shard, generations, worker_id,
+          timeout=DEFAULT_LEASE_TIMEOUT, observed=None):
+    """
+    Try to lease a shard.
+
+    workdir     -- Work directory shared by the workers
+    shard       -- ID of the shard to lease
+    generations -- Highest lease generation per shard, see
+                   _lease_generations()
+    worker_id   -- ID of the claiming worker
+    timeout     -- Seconds without a heartbeat before a lease expires
+    observed    -- Dictionary kept by the caller across calls, mapping
+                   each lease file to its last seen mtime and the local
+                   time it was first seen (default None, no lease is
+                   considered expired)
+
+    Returns:
+    Lease held by the worker, or None if the shard is leased by a live
+    worker or another worker won the race.
+    """
+    generation = generations.get(shard)
+    if generation is not None:
+        current = os.path.join(workdir, LEASES_DIR,
+                               '{0}.{1}'.format(shard, generation))
+        try:
+            mtime = os.stat(current).st_mtime
+        except OSError:
+            # Released after the listing; try again on the next scan.
+            return None
+        if observed is None:
+            return None
+        now = time.time()
+        last_mtime, since = observed.get(current, (None, now))
+        if mtime != last_mtime:
+            observed[current] = (mtime, now)
+            return None
+        if now - since < timeout:
+            return None
+        del observed[current]
+        generation += 1
+    else:
+        generation = 0
+    lease = Lease(workdir, shard, generation, worker_id, timeout)
+    return lease if lease.acquire() else None
+
+
+def process_shard(workdir, shard, lease=None):
+    """
+    Verify every bank in a shard and atomically write its result file.
+
+    Returns:
+    List of result dictionaries, see sc2bank.verify_bank(). None if the
+    lease was lost to another worker before the results could be
+    published.
+    """
+    results = [sc2bank.verify_bank(path)
+               for path in read_shard(workdir, shard)]
+    if lease is not None and not lease.held():
+        return None
+    _write_atomic(result_path(workdir, shard),
+                  ''.join(json.dumps(r, sort_keys=True) + '\n'
+                          for r in results))
+    return results
+
+
+def work(workdir, worker_id=None, timeout=DEFAULT_LEASE_TIMEOUT,
+         poll_interval=None):
+    """
+    Process shards until every shard in the work directory has a result.
+
+    workdir       -- Work directory shared by the workers
+    worker_id     -- ID of this worker (default derived from host and PID)
+    timeout       -- Seconds without a heartbeat before a lease expires
+    poll_interval -- Seconds to wait while the remaining shards are leased
+                     by other workers (default a quarter of timeout)
+
+    Returns:
+    List of the shard IDs this worker completed.
+    """
+    if worker_id is None:
+        worker_id = default_worker_id()
+    if poll_interval is None:
+        poll_interval = timeout / 4.0
+    done, observed = [], {}
+    while True:
+        pending = [s for s in shard_ids(workdir)
+                   if not os.path.exists(result_path(workdir, s))]
+        if not pending:
+            return done
+        generations = _lease_generations(workdir)
+        progressed = False
+        for shard in pending:
+            lease = claim(workdir, shard, generations, worker_id, timeout,
+                          observed)
+            if lease is None:
+                continue
+            try:
+                # Another worker may have finished it since the scan.
+                if os.path.exists(result_path(workdir, shard)):
+                    continue
+                if process_shard(workdir, shard, lease) is not None:
+                    done.append(shard)
+                    progressed = True
+            finally:
+                lease.release()
+        if not progressed:
+            time.sleep(poll_interval)
+
+
+def merge(workdir):
+    """
+    Combine the per-shard results of a work directory.
+
+    Returns:
+    List of result dictionaries in shard order, see sc2bank.verify_bank().
+    """
+    shards = shard_ids(workdir)
+    missing = [s for s in shards
+               if not os.path.exists(result_path(workdir, s))]
+    if missing:
+        raise RuntimeError('Shards without results: ' + ', '.join(missing))
+    results = []
+    for shard in shards:
+        with open(result_path(workdir, shard), 'r') as f:
+            results.extend(json.loads(line) for line in f if line.strip())
+    return results
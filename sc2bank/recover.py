@@ -0,0 +1,162 @@
+"""
+Recover the identity of a SC2Bank whose path no longer carries it.
+
+A bank copied out of its Accounts/.../Banks/<author> folder can only be
+verified once its Author ID, User ID and name are known again. recover()
+searches candidate combinations for the one that reproduces the recorded
+signature. The identity is hashed before the bank's contents, so the
+contents still have to be hashed for every candidate; they are encoded
+only once, and the hash state after each Author ID and User ID prefix is
+shared by all candidates that start with it. The search is spread over a
+process pool.
+"""
+
+import binascii
+import hashlib
+import multiprocessing
+import os
+from . import sc2bank
+
+
+DEFAULT_CHUNK_SIZE = 4096
+
+_search = {}
+
+
+def id_range(spec):
+    """
+    Expand an ID range such as 1-S2-1-4337000:4338000 (inclusive).
+
+    Returns:
+    List of IDs.
+    """
+    prefix, _, span = spec.rpartition('-')
+    start, _, end = span.partition(':')
+    if not (prefix and start.isdigit() and end.isdigit()):
+        raise ValueError('Invalid ID range: ' + spec)
+    width = len(start)
+    return ['{0}-{1:0{2}d}'.format(prefix, n, width)
+            for n in range(int(start), int(end) + 1)]
+
+
+def ids_from_file(fname):
+    """IDs listed one per line in a file."""
+    with open(fname, 'r') as f:
+        return [line.strip().upper() for line in f if line.strip()]
+
+
+def ids_from_tree(root):
+    """IDs found as directory names anywhere below root."""
+    ids = set()
+    for _, dirnames, _ in os.walk(root):
+        ids.update(d.upper() for d in dirnames
+                   if sc2bank.is_id(d.upper()))
+    return sorted(ids)
+
+
+def _init(body, author_ids, user_ids, names, target):
+    _search.update(body=body,
+                   author_ids=author_ids,
+                   user_ids=[(u, u.encode('UTF-8')) for u in user_ids],
+                   names=[(n, n.encode('UTF-8')) for n in names],
+                   target=target)
+
+
+def _search_block(block):
+    """Search Author IDs [a:b) combined with User IDs [c:d)."""
+    a, b, c, d = block
+    body, target = _search['body'], _search['target']
+    user_ids, names = _search['user_ids'][c:d], _search['names']
+    for author_id in _search['author_ids'][a:b]:
+        by_author = hashlib.sha1(author_id.encode('UTF-8'))
+        for user_id, encoded_user_id in user_ids:
+            by_user = by_author.copy()
+            by_user.update(encoded_user_id)
+            for name, encoded_name in names:
+                h = by_user.copy()
+                h.update(encoded_name)
+                h.update(body)
+                if h.digest() == target:
+                    return sc2bank.PathInfo(author_id, user_id, name)
+    return None
+
+
+def recover(bank, signature, author_ids, user_ids, names, processes=None,
+            chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Search for the identity that signs a SC2Bank with a given signature.
+
+    bank       -- List of Section class instances
+    signature  -- Signature recorded in the XML document
+    author_ids -- Candidate Author IDs
+    user_ids   -- Candidate User IDs
+    names      -- Candidate SC2Bank names
+    processes  -- Number of search processes (default CPU count). With 1
+                  the search runs in this process.
+    chunk_size -- Approximate number of Author ID and User ID pairs per
+                  task
+
+    Returns:
+    PathInfo of the matching identity, or None if no candidate matches.
+    """
+    try:
+        target = binascii.unhexlify(signature)
+    except (TypeError, ValueError):  # binascii.Error is a ValueError
+        target = None
+    if target is None or len(target) != hashlib.sha1().digest_size:
+        raise RuntimeError('Invalid signature: ' + signature)
+    author_ids, user_ids, names = list(author_ids), list(user_ids), \
+        list(names)
+    if not (author_ids and user_ids and names):
+        return None
+    args = (sc2bank.canonical_body(bank), author_ids, user_ids, names,
+            target)
+    # Split the Author ID by User ID grid into blocks of about chunk_size
+    # pairs, so the work spreads over the pool whichever list is longer.
+    user_step = max(1, min(len(user_ids), chunk_size))
+    author_step = max(1, chunk_size // user_step)
+    blocks = ((a, a + author_step, c, c + user_step)
+              for a in range(0, len(author_ids), author_step)
+              for c in range(0, len(user_ids), user_step))
+    if processes == 1:
+        _init(*args)
+        try:
+            for block in blocks:
+                found = _search_block(block)
+                if found is not None:
+                    return found
+            return None
+        finally:
+            _search.clear()
+    pool = multiprocessing.Pool(processes, _init, args)
+    try:
+        for found in pool.imap_unordered(_search_block, blocks):
+            if found is not None:
+                return found
+        return None
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def recover_file(fname, author_ids, user_ids, names=None, processes=None):
+    """
+    Search for the identity of a SC2Bank file, see recover().
+
+    names -- Candidate SC2Bank names (default the file's name, without
+             its extension)
+
+    Returns:
+    PathInfo of the matching identity, or None if no candidate matches.
+    """
+    if not names:
+        name = sc2bank.inspect_path(fname).name or \
+            os.path.splitext(os.path.basename(fname))[0]
+        if not name:
+            raise RuntimeError('Cannot derive a SC2Bank name from the path, '
+                               'specify one.')
+        names = [name]
+    bank, signature = sc2bank.parse(fname)
+    if signature is None:
+        raise RuntimeError('No signature in XML document.')
+    return recover(bank, signature, author_ids, user_ids, names, processes)
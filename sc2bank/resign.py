@@ -0,0 +1,370 @@
+"""
+Re-sign many SC2Bank files at once, e.g. after an Author ID rotation.
+
+New signatures are calculated in a process pool. Files are rewritten by a
+bounded thread pool through a temporary file and a rename, so a bank is
+never left half written. Directory fsyncs are grouped per batch of
+banks. Every run keeps a journal of JSON lines: a header with the bank
+list and identity overrides, a record with the old and new signature of
+each bank before it is rewritten, and a record once a batch is durable.
+A bank that cannot be signed or rewritten is recorded as failed and
+skipped, without holding up the rest of its batch. An interrupted run can
+be resumed, or rolled back to the old signatures.
+"""
+
+import json
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import os
+import re
+from itertools import islice
+from . import sc2bank
+
+
+DEFAULT_IO_THREADS = 8
+DEFAULT_BATCH_SIZE = 256
+
+_replace = getattr(os, 'replace', os.rename)  # Python 2.x has no replace
+
+
+def replace_signature(contents, old, new):
+    """
+    Replace the Signature tag's value in a SC2Bank document.
+
+    contents -- SC2Bank document as bytes
+    old      -- Signature expected in the document
+    new      -- Signature to record instead
+
+    Returns:
+    The rewritten document, or None if it already records new.
+    """
+    def pattern(signature):
+        return re.compile(b'(<Signature\\s+value=")' +
+                          re.escape(signature.encode('ascii')) + b'"')
+    if old == new or pattern(new).search(contents):
+        return None
+    if old is None:
+        raise RuntimeError('No signature in XML document.')
+    rewritten, count = pattern(old).subn(
+        lambda m: m.group(1) + new.encode('ascii') + b'"', contents)
+    if count != 1:
+        raise RuntimeError('Expected one signature {0}, found {1}.'
+                           .format(old, count))
+    return rewritten
+
+
+def swap_signature(path, old, new):
+    """
+    Atomically rewrite a SC2Bank file with a new signature.
+
+    The new contents are written to a temporary file in the same directory,
+    fsynced, and renamed over the original. The directory itself is not
+    fsynced, see fsync_directories().
+
+    Returns:
+    True if the file was rewritten, False if it already recorded new.
+    """
+    with open(path, 'rb') as f:
+        contents = replace_signature(f.read(), old, new)
+    if contents is None:
+        return False
+    tmp = '{0}.resign.{1}'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(contents)
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+        _replace(tmp, path)
+    except Exception:
+        os.remove(tmp)
+        raise
+    return True
+
+
+def fsync_directories(paths):
+    """fsync each distinct parent directory of paths once."""
+    if os.name == 'nt':
+        return  # Directories cannot be opened for fsync on Windows.
+    for directory in set(os.path.dirname(os.path.abspath(p)) for p in paths):
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class Journal(object):
+    """Append-only record of a re-sign run."""
+
+    def __init__(self, path):
+        """
+        path -- Path of the journal file
+        """
+        self.path = path
+
+    def create(self, paths, author_id=None, user_id=None):
+        """Start a journal for a new run over paths."""
+        if os.path.exists(self.path):
+            raise RuntimeError('Journal already exists: ' + self.path)
+        self._append([{'paths': list(paths),
+                       'author_id': author_id,
+                       'user_id': user_id}])
+
+    def load(self):
+        """
+        Read the journal back.
+
+        Returns:
+        Tuple of the header dictionary (with rolled_back set once the run
+        was rolled back), a dictionary mapping each planned path to its old
+        and new signature, the set of paths whose rewrite is durable, and a
+        dictionary mapping each failed path to its error message.
+        """
+        planned, done, failed = {}, set(), {}
+        with open(self.path, 'r') as f:
+            lines = [line for line in f if line.strip()]
+        if not lines:
+            raise RuntimeError('Empty journal: ' + self.path)
+        header = json.loads(lines[0])
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Torn final write of an interrupted run.
+            if 'done' in record:
+                done.update(record['done'])
+            elif 'failed' in record:
+                failed.update(record['failed'])
+            elif 'rollback_failed' in record:
+                pass  # Reported by rollback(), which retries them.
+            elif 'rolled_back' in record:
+                header['rolled_back'] = True
+            else:
+                planned[record['path']] = (record['old'], record['new'])
+        return header, planned, done, failed
+
+    def plan(self, entries):
+        """Record (path, old, new) entries before rewriting them."""
+        self._append({'path': p, 'old': o, 'new': n} for p, o, n in entries)
+
+    def done(self, paths):
+        """Record that the rewrites of paths are durable."""
+        self._append([{'done': list(paths)}])
+
+    def failed(self, errors):
+        """Record paths that could not be re-signed with their errors."""
+        self._append([{'failed': errors}])
+
+    def rollback_failed(self, errors):
+        """Record paths whose old signature could not be restored."""
+        self._append([{'rollback_failed': errors}])
+
+    def rolled_back(self):
+        """Record that the run was rolled back."""
+        self._append([{'rolled_back': True}])
+
+    def _truncate_torn_line(self):
+        """
+        Cut off a final line left incomplete by an interrupted run, so
+        the next record does not get appended to it.
+        """
+        try:
+            f = open(self.path, 'rb+')
+        except (IOError, OSError):
+            return  # No journal yet.
+        with f:
+            f.seek(0, os.SEEK_END)
+            end = pos = f.tell()
+            while pos > 0:
+                start = max(0, pos - 4096)
+                f.seek(start)
+                newline = f.read(pos - start).rfind(b'\n')
+                if newline != -1:
+                    pos = start + newline + 1
+                    break
+                pos = start
+            if pos == end:
+                return
+            f.truncate(pos)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _append(self, records):
+        self._truncate_torn_line()
+        with open(self.path, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _error(e):
+    return '{0}: {1}'.format(type(e).__name__, e)
+
+
+def _sign_task(task):
+    path, author_id, user_id = task
+    try:
+        signature, recorded = sc2bank.sign_file(path, author_id=author_id,
+                                                user_id=user_id)
+    except Exception as e:
+        return path, None, None, _error(e)
+    return path, recorded, signature, None
+
+
+def _swap_task(entry):
+    try:
+        return swap_signature(*entry), None
+    except Exception as e:
+        return False, _error(e)
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _apply(entries, journal, io_threads, batch_size, record_plan=True):
+    """
+    Rewrite (path, old, new, error) entries batch by batch.
+
+    Entries with an error from signing are not rewritten. They and the
+    banks that cannot be rewritten are recorded as failed.
+
+    Returns:
+    Tuple of the number of files rewritten and a dictionary mapping each
+    failed path to its error message.
+    """
+    rewritten, failed = 0, {}
+    io = ThreadPool(io_threads)
+    try:
+        for batch in _batches(entries, batch_size):
+            errors = dict((p, e) for p, _, _, e in batch if e is not None)
+            signed = [(p, o, n) for p, o, n, e in batch if e is None]
+            if record_plan:
+                journal.plan(signed)
+            for (path, _, _), (swapped, error) in \
+                    zip(signed, io.map(_swap_task, signed)):
+                if error is None:
+                    rewritten += swapped
+                else:
+                    errors[path] = error
+            fsync_directories(p for p, _, _ in signed if p not in errors)
+            if errors:
+                journal.failed(errors)
+                failed.update(errors)
+            journal.done(p for p, _, _ in signed if p not in errors)
+    finally:
+        io.close()
+        io.join()
+    return rewritten, failed
+
+
+def resume(journal_path, processes=None, io_threads=DEFAULT_IO_THREADS,
+           batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Continue a re-sign run from its journal.
+
+    journal_path -- Path of the run's journal
+    processes    -- Number of signing processes (default CPU count)
+    io_threads   -- Number of threads rewriting files
+    batch_size   -- Number of banks per journal and directory fsync batch
+
+    Banks that failed in an earlier attempt are not retried.
+
+    Returns:
+    Tuple of the number of files rewritten and a dictionary mapping each
+    bank that failed in this run or earlier attempts to its error message.
+    """
+    journal = Journal(journal_path)
+    header, planned, done, failed = journal.load()
+    if header.get('rolled_back'):
+        raise RuntimeError('Run was rolled back: ' + journal_path)
+    todo = [p for p in header['paths'] if p not in done and p not in failed]
+    replay = [(p,) + planned[p] + (None,) for p in todo if p in planned]
+    tasks = [(p, header['author_id'], header['user_id'])
+             for p in todo if p not in planned]
+    rewritten, errors = _apply(replay, journal, io_threads, batch_size,
+                               record_plan=False)
+    failed.update(errors)
+    if not tasks:
+        return rewritten, failed
+    pool = multiprocessing.Pool(processes)
+    try:
+        signed = pool.imap(_sign_task, tasks,
+                           chunksize=max(1, min(64, len(tasks) // 64)))
+        count, errors = _apply(signed, journal, io_threads, batch_size)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    failed.update(errors)
+    return rewritten + count, failed
+
+
+def resign(paths, journal_path, author_id=None, user_id=None,
+           processes=None, io_threads=DEFAULT_IO_THREADS,
+           batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Re-sign SC2Bank files, recording the run in a new journal.
+
+    paths        -- Paths of the SC2Bank files
+    journal_path -- Path of the journal to create
+    author_id    -- Author ID to sign with (default None, derived from
+                    each path)
+    user_id      -- User ID to sign with (default None, derived from
+                    each path)
+
+    See resume() for the remaining arguments.
+
+    Returns:
+    Tuple of the number of files rewritten and a dictionary mapping each
+    failed bank to its error message.
+    """
+    Journal(journal_path).create(paths, author_id, user_id)
+    return resume(journal_path, processes, io_threads, batch_size)
+
+
+def rollback(journal_path, io_threads=DEFAULT_IO_THREADS,
+             batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Restore the old signature of every bank planned in a journal.
+
+    Banks recorded as failed were not rewritten and are left alone. Banks
+    that cannot be restored are recorded in the journal and skipped; a
+    later rollback tries them again.
+
+    Returns:
+    Tuple of the number of files rewritten and a dictionary mapping each
+    bank that could not be restored to its error message.
+    """
+    journal = Journal(journal_path)
+    _, planned, _, failed = journal.load()
+    entries = [(p, new, old) for p, (old, new) in sorted(planned.items())
+               if p not in failed]
+    io = ThreadPool(io_threads)
+    rewritten, errors = 0, {}
+    try:
+        for batch in _batches(entries, batch_size):
+            batch_errors = {}
+            for (path, _, _), (swapped, error) in \
+                    zip(batch, io.map(_swap_task, batch)):
+                if error is None:
+                    rewritten += swapped
+                else:
+                    batch_errors[path] = error
+            fsync_directories(p for p, _, _ in batch
+                              if p not in batch_errors)
+            if batch_errors:
+                journal.rollback_failed(batch_errors)
+                errors.update(batch_errors)
+    finally:
+        io.close()
+        io.join()
+    journal.rolled_back()
+    return rewritten, errors
@@ -1,7 +1,7 @@
 """
 Validate SC2Bank XML document signatures.
 
-This module parses and validates SC2Bank files used to store player
+This module parses, validates, and writes SC2Bank files used to store player
 data associated with a StarCraft II map. SC2Bank files are utilized
 to track player unlocks in the Arcade. Armed with a text editor, one
 may artificially achieve player unlocks. This module can be either
@@ -12,15 +12,18 @@ $ python sc2bank.py "$HOME/Library/Application Support/Blizzard/StarCraft II\
 llIlIIlIlIllIllI.SC2Bank"
 """
 
+# Keep the imports light; this module is on the CLI's verify path. Documents
+# are parsed with pyexpat directly, as importing xml.etree.ElementTree and
+# re costs more than verifying a typical SC2Bank.
 from collections import namedtuple
 import hashlib
+from io import BytesIO
 import os
-import re
+import pyexpat
 try:
     from StringIO import StringIO
 except ImportError:
     from io import StringIO  # Python 3.x
-import xml.etree.ElementTree as ET
 
 
 class Section(object):
@@ -65,6 +68,15 @@ class Key(object):
 PathInfo = namedtuple('PathInfo', ['author_id', 'user_id', 'name'])
 
 
+PARSE_CHUNK_SIZE = 64 * 1024
+WRITE_CHUNK_SIZE = 64 * 1024
+
+# xml.sax.saxutils.quoteattr would do, but importing it pulls in urllib.
+_ATTRIBUTE_ESCAPES = [('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'),
+                      ('"', '&quot;'), ('\n', '&#10;'), ('\r', '&#13;'),
+                      ('\t', '&#9;')]
+
+
 def safe_list_get(l, index, default=None):
     """
     Get value for index in l. If index is out of range, return default
@@ -76,6 +88,17 @@ def safe_list_get(l, index, default=None):
         return default
 
 
+def is_id(s):
+    """True if s looks like an Author ID or User ID, e.g. 1-S2-1-1234567."""
+    parts = s.split('-')
+    digits = lambda p: p != '' and all(c in '0123456789' for c in p)
+    return (len(parts) == 4 and
+            len(parts[0]) == 1 and digits(parts[0]) and
+            parts[1] == 'S2' and
+            len(parts[2]) == 1 and digits(parts[2]) and
+            len(parts[3]) in (6, 7) and digits(parts[3]))
+
+
 def inspect_path(path):
     """
     Inspect a SC2Bank file's path for metadata necessary to generate a
@@ -88,55 +111,116 @@ def inspect_path(path):
     if the information could not be deduced.
     """
     elements = os.path.dirname(path).split(os.sep)
-    id_ = re.compile('^[0-9]-S2-[0-9]-[0-9]{6,7}$')
     # Author ID & User ID are no use if in lower case.
     author_element = safe_list_get(elements, -1, '').upper()
     user_element = safe_list_get(elements, -3, '').upper()
-    author_id, user_id = [e if re.match(id_, e) else None
+    author_id, user_id = [e if is_id(e) else None
                           for e in (author_element, user_element)]
-    found = re.match('^(.+)(\.SC2Bank)$', os.path.basename(path), re.I)
-    if found:
-        bank_name = found.group(1)
+    basename = os.path.basename(path)
+    if len(basename) > 8 and basename[-8:].lower() == '.sc2bank':
+        bank_name = basename[:-8]
     else:
         bank_name = None
     return PathInfo(author_id, user_id, bank_name)
 
 
+class BankParser(object):
+    """
+    Collect Sections, Keys, and the Signature from pyexpat events.
+
+    Subclasses may override begin_section() and add_key() to consume the
+    document as it is parsed instead of collecting the bank.
+    """
+
+    def __init__(self):
+        self.bank = []
+        self.signature = None
+        self.depth = 0
+        self.in_section = False
+        self.key = None
+        self.value = None
+        self.has_signature = False
+
+    def start(self, tag, attrib):
+        self.depth += 1
+        if self.depth == 1:
+            if tag != 'Bank':
+                raise RuntimeError('Invalid root tag: ' + tag)
+        elif self.depth == 2:
+            if tag == 'Section':
+                self.begin_section(attrib['name'])
+                self.in_section = True
+            elif tag == 'Signature' and not self.has_signature:
+                self.signature = attrib.get('value')
+                self.has_signature = True
+        elif self.depth == 3:
+            if tag == 'Key' and self.in_section:
+                self.key, self.value = attrib['name'], None
+        elif self.depth == 4:
+            if tag == 'Value' and self.key is not None and self.value is None:
+                # Do not look for "int" or "string" attributes. Instead get
+                # only the attribute's name or raise an exception. This
+                # future-proofs for unknown value types.
+                if len(attrib) != 1:
+                    element = '<Value {0}/>'.format(''.join(
+                        '{0}={1} '.format(k, quoteattr(v))
+                        for k, v in sorted(attrib.items())))
+                    raise RuntimeError('Unknown value type in {0}'
+                                       .format(element))
+                self.value = list(attrib.items())[0]
+
+    def end(self, tag):
+        self.depth -= 1
+        if self.depth == 2 and self.key is not None:
+            if self.value is None:
+                raise RuntimeError('No Value tag in Key ' + self.key)
+            self.add_key(Key(self.key, *self.value))
+            self.key = None
+        elif self.depth == 1:
+            self.in_section = False
+
+    def begin_section(self, name):
+        """Called with each Section tag's name attribute, in order."""
+        self.bank.append(Section(name, []))
+
+    def add_key(self, key):
+        """Called with each Key of the current Section, in order."""
+        self.bank[-1].keys.append(key)
+
+    def parse(self, f):
+        parser = pyexpat.ParserCreate()
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        try:
+            while True:
+                data = f.read(PARSE_CHUNK_SIZE)
+                if not data:
+                    break
+                parser.Parse(data, False)
+            parser.Parse(b'', True)
+        except pyexpat.ExpatError as e:
+            # Raise what xml.etree.ElementTree.parse raised before.
+            import xml.etree.ElementTree as ET
+            err = ET.ParseError(str(e))
+            err.code, err.position = e.code, (e.lineno, e.offset)
+            raise err
+        return self.bank, self.signature
+
+
 def parse(fname):
     """
     Parse a SC2Bank file.
 
-    fname -- Path to the SC2Bank file
+    fname -- Path to the SC2Bank file or a file object to read it from
 
     Returns:
     Tuple of the parsed Bank element and the signature recorded in
     the XML document.
     """
-    root = ET.parse(fname).getroot()
-    if root.tag != 'Bank':
-        raise RuntimeError('Invalid root tag: ' + root.tag)
-    bank = []
-    for section in root.findall('./Section'):
-        keys = []
-        for key in section.findall('./Key'):
-            value = key.find('./Value')
-            # Do not look for "int" or "string" attributes. Instead get only
-            # the attribute's name or raise an exception. This future-proofs
-            # for unknown value types.
-            if len(value.attrib) == 1:
-                value_type = list(value.attrib.keys())[0]
-            else:
-                element = ET.tostring(value).rstrip().decode('UTF-8')
-                raise RuntimeError('Unknown value type in {}'.format(element))
-            key = Key(key.attrib['name'], value_type, value.attrib[value_type])
-            keys.append(key)
-        bank.append(Section(section.attrib['name'], keys))
-    signature_element = root.find('./Signature')
-    if signature_element is not None:
-        signature = signature_element.get('value')
-    else:
-        signature = None
-    return bank, signature
+    if not hasattr(fname, 'read'):
+        with open(fname, 'rb') as f:
+            return parse(f)
+    return BankParser().parse(fname)
 
 
 def parse_string(xml_string):
@@ -147,6 +231,23 @@ def parse_string(xml_string):
     return parsed_sc2bank
 
 
+def canonical_strings(bank):
+    """
+    Generate the strings hashed after the identity when signing, in order.
+
+    bank -- List of Section class instances
+    """
+    for section in sorted(bank):
+        yield section.name
+        for key in sorted(section.keys):
+            yield ''.join([key.name, 'Value', key.type, key.value])
+
+
+def canonical_body(bank):
+    """Encoded part of a signature's input that follows the identity."""
+    return ''.join(canonical_strings(bank)).encode('UTF-8')
+
+
 def sign(author_id, user_id, name, bank):
     """
     Sign a SC2Bank file representation.
@@ -162,43 +263,82 @@ def sign(author_id, user_id, name, bank):
     h = hashlib.sha1()
     update = lambda s: h.update(''.join(s).encode('UTF-8'))
     update([author_id, user_id, name])
-    for section in sorted(bank):
-        update(section.name)
-        for key in sorted(section.keys):
-            update([key.name, 'Value', key.type, key.value])
+    for s in canonical_strings(bank):
+        h.update(s.encode('UTF-8'))
     return h.hexdigest().upper()
 
 
-def sign_file(fname, author_id=None, user_id=None, name=None):
+def identity(path, author_id=None, user_id=None, name=None):
+    """
+    Fill in the metadata necessary to generate a signature.
+
+    path -- Path to the SC2Bank file to derive metadata from when one of
+            author_id, user_id, or name is None
+
+    Returns:
+    PathInfo of the Author ID, User ID, and Bank name.
+    """
+    if None in (author_id, user_id, name):
+        info = inspect_path(path)
+        if author_id is None:
+            author_id = info.author_id
+        if user_id is None:
+            user_id = info.user_id
+        if name is None:
+            name = info.name
+    return PathInfo(author_id, user_id, name)
+
+
+def sign_file(fname, author_id=None, user_id=None, name=None, path=None):
     """
     Sign a SC2Bank file.
 
-    fname     -- Path to the SC2Bank file
+    fname     -- Path to the SC2Bank file or a file object to read it from
     author_id -- Author ID, e.g. "1-S2-1-1234567"
                  (default None, derived from last directory element)
     user_id   -- User ID, e.g. "1-S2-1-1234567" (default None,
                  derived from third to last directory element)
     name      -- SC2Bank filename without .SC2Bank or the file's path
                  (default None)
+    path      -- Path to derive missing metadata from, e.g. an archive
+                 member's name (default fname)
 
     Returns:
     Tuple of the calculated signature and the signature recorded in
     the XML document.
     """
-    if None in (author_id, user_id, name):
-        info = inspect_path(fname)
-        if author_id is None:
-            author_id = info.author_id
-        if user_id is None:
-            user_id = info.user_id
-        if name is None:
-            name = info.name
+    author_id, user_id, name = identity(fname if path is None else path,
+                                        author_id, user_id, name)
 
     bank, signature = parse(fname)
 
     return sign(author_id, user_id, name, bank), signature
 
 
+def verify_bank(path, source=None):
+    """
+    Verify a single SC2Bank file, deriving its identity from the path.
+
+    path   -- Path to the SC2Bank file
+    source -- File object to read the SC2Bank from instead (default None)
+
+    Returns:
+    Dictionary with the path, calculated and recorded signatures, whether
+    they match, and the error message if the bank could not be verified.
+    """
+    result = {'path': path, 'signature': None, 'recorded': None,
+              'ok': False, 'error': None}
+    try:
+        signature, recorded = sign_file(
+            path if source is None else source, path=path)
+    except Exception as e:
+        result['error'] = '{0}: {1}'.format(type(e).__name__, e)
+    else:
+        result.update(signature=signature, recorded=recorded,
+                      ok=signature == recorded)
+    return result
+
+
 def sign_string(xml_string, author_id, user_id, name):
     """
     Sign a SC2Bank from a string.
@@ -215,3 +355,79 @@ def sign_string(xml_string, author_id, user_id, name):
     bank, signature = parse_string(xml_string)
 
     return sign(author_id, user_id, name, bank), signature
+
+
+def write(fname, bank, author_id, user_id, name,
+          chunk_size=WRITE_CHUNK_SIZE):
+    """
+    Write a SC2Bank document in canonical order and sign it in the same
+    pass.
+
+    fname      -- Path to write the SC2Bank file to or a binary file
+                  object
+    bank       -- List of Section class instances
+    author_id  -- Author ID, e.g. "1-S2-1-1234567"
+    user_id    -- User ID, e.g. "1-S2-1-1234567"
+    name       -- SC2Bank filename without .SC2Bank and file's path
+    chunk_size -- Number of bytes buffered between writes
+
+    Returns:
+    The signature recorded in the written XML document.
+    """
+    if not hasattr(fname, 'write'):
+        with open(fname, 'wb') as f:
+            return write(f, bank, author_id, user_id, name, chunk_size)
+    h = hashlib.sha1()
+    h.update(''.join([author_id, user_id, name]).encode('UTF-8'))
+    chunk, size = [], 0
+    for piece in _document(bank, h):
+        piece = piece.encode('UTF-8')
+        chunk.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            fname.write(b''.join(chunk))
+            chunk, size = [], 0
+    fname.write(b''.join(chunk))
+    return h.hexdigest().upper()
+
+
+def quoteattr(value):
+    """Escape and double quote value for use as an XML attribute."""
+    for char, entity in _ATTRIBUTE_ESCAPES:
+        value = value.replace(char, entity)
+    return '"' + value + '"'
+
+
+def _document(bank, h):
+    """
+    Generate a SC2Bank document's text in canonical order, updating the
+    SHA-1 object h with the signature's input along the way.
+    """
+    yield '<?xml version="1.0" encoding="utf-8"?>\n<Bank version="1">\n'
+    for section in sorted(bank):
+        h.update(section.name.encode('UTF-8'))
+        yield '    <Section name={0}>\n'.format(quoteattr(section.name))
+        for key in sorted(section.keys):
+            h.update(''.join([key.name, 'Value', key.type, key.value])
+                     .encode('UTF-8'))
+            yield ('        <Key name={0}>\n'
+                   '            <Value {1}={2}/>\n'
+                   '        </Key>\n'.format(quoteattr(key.name), key.type,
+                                             quoteattr(key.value)))
+        yield '    </Section>\n'
+    yield '    <Signature value="{0}"/>\n</Bank>\n'.format(
+        h.hexdigest().upper())
+
+
+def write_string(bank, author_id, user_id, name):
+    """
+    Write a SC2Bank to a string, see write().
+
+    Returns:
+    Tuple of the XML document and its signature.
+    """
+    buf = BytesIO()
+    signature = write(buf, bank, author_id, user_id, name)
+    xml_string = buf.getvalue().decode('UTF-8')
+    buf.close()
+    return xml_string, signature
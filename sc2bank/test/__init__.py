@@ -0,0 +1,46 @@
+import os
+
+
+# A SC2Bank signed for the Author ID, User ID, and name in BANKS and
+# BANK_NAME.
+CONTENTS = """<?xml version="1.0" encoding="utf-8"?>
+<Bank version="1">
+    <Section name="lllllIIlIllIIllI">
+        <Key name="lllllllIlIllIIII">
+            <Value int="5"/>
+        </Key>
+    </Section>
+    <Section name="IIlIlIIlllIIII">
+        <Key name="IllIIIIIlIIIII">
+            <Value int="780000"/>
+        </Key>
+    </Section>
+    <Signature value="3ECC1CCD9762908DE09D322235D5ED4D13CD1C53"/>
+</Bank>
+"""
+
+SIGNATURE = '3ECC1CCD9762908DE09D322235D5ED4D13CD1C53'
+BANK_NAME = 'llIlIIlIlIllIllI'
+
+# Banks folder of Author ID 1-S2-1-4337146 and User ID 1-S2-1-4253458.
+BANKS = ('Accounts', '12345678', '1-S2-1-4253458', 'Banks', '1-S2-1-4337146')
+
+
+def make_banks(root, names=(BANK_NAME,)):
+    """
+    Write CONTENTS to SC2Bank files in the BANKS folder below root.
+
+    names -- SC2Bank names without .SC2Bank
+
+    Returns:
+    List of the SC2Bank paths in the order of names.
+    """
+    banks = os.path.join(root, *BANKS)
+    os.makedirs(banks)
+    paths = []
+    for name in names:
+        path = os.path.join(banks, name + '.SC2Bank')
+        with open(path, 'w') as f:
+            f.write(CONTENTS)
+        paths.append(path)
+    return paths
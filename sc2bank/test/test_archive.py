@@ -0,0 +1,99 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from ..archive import iter_members, verify_archive, member_path
+from . import CONTENTS as BANK_XML, BANKS as BANK_DIRS
+import unittest
+
+
+CONTENTS = BANK_XML.encode('UTF-8')
+BANKS = '/'.join(BANK_DIRS) + '/'
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.members = [BANKS + 'llIlIIlIlIllIllI.SC2Bank',
+                        BANKS + 'other.SC2Bank',
+                        'Accounts/orphan.SC2Bank']
+        self.others = {'Accounts/readme.txt': b'not a bank',
+                       BANKS + 'broken.SC2Bank': b'<Bank>'}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def make_zip(self):
+        fname = os.path.join(self.tmp, 'banks.zip')
+        with zipfile.ZipFile(fname, 'w', zipfile.ZIP_DEFLATED) as z:
+            for name in self.members:
+                z.writestr(name, CONTENTS)
+            for name, data in sorted(self.others.items()):
+                z.writestr(name, data)
+        return fname
+
+    def make_tar(self, suffix='.tar.gz', mode='w:gz'):
+        fname = os.path.join(self.tmp, 'banks' + suffix)
+        with tarfile.open(fname, mode) as t:
+            items = [(n, CONTENTS) for n in self.members] + \
+                sorted(self.others.items())
+            for name, data in items:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                t.addfile(info, io.BytesIO(data))
+        return fname
+
+    def check(self, fname):
+        paths = [member_path(n) for n in self.members] + \
+            [member_path(BANKS + 'broken.SC2Bank')]
+        self.assertEquals([p for p, _ in iter_members(fname)], paths)
+        for processes in (1, 2):
+            results = list(verify_archive(fname, processes=processes,
+                                          window=2))
+            self.assertEquals([r['path'] for r in results], paths)
+            self.assertEquals([r['ok'] for r in results],
+                              [True, False, False, False])
+            # The orphan has no Author ID or User ID in its path.
+            self.assertNotEqual(results[2]['error'], None)
+            self.assertTrue(results[3]['error'].startswith('ParseError'))
+
+    def test_zip(self):
+        self.check(self.make_zip())
+
+    def test_damaged_zip(self):
+        fname = self.make_zip()
+        with zipfile.ZipFile(fname) as z:
+            offset = z.getinfo(self.members[1]).header_offset
+        # Damage the file name in the second member's local header.
+        with open(fname, 'r+b') as f:
+            f.seek(offset + 30)
+            f.write(b'X')
+        for processes in (1, 2):
+            results = list(verify_archive(fname, processes=processes))
+            self.assertEquals(len(results), 4)
+            self.assertEquals([r['ok'] for r in results],
+                              [True, False, False, False])
+            self.assertTrue(results[1]['error'].startswith('BadZip'))
+
+    def test_tar(self):
+        self.check(self.make_tar())
+        self.check(self.make_tar('.tar', 'w'))
+
+    def test_zst(self):
+        try:
+            import zstandard
+        except ImportError:
+            raise unittest.SkipTest('zstandard is not installed')
+        tar = self.make_tar('.tar', 'w')
+        fname = tar + '.zst'
+        with open(tar, 'rb') as src:
+            with open(fname, 'wb') as dst:
+                zstandard.ZstdCompressor().copy_stream(src, dst)
+        self.check(fname)
+
+
+if __name__ == '__main__':
+    unittest.main()
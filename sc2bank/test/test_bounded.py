@@ -0,0 +1,86 @@
+import random
+from io import BytesIO
+from ..bounded import sign_file, _RunWriter, RECORD_OVERHEAD
+from ..sc2bank import Section, Key, sign, write
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+from . import CONTENTS, SIGNATURE, BANK_NAME
+import unittest
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.author_id = '1-S2-1-4337146'
+        self.user_id = '1-S2-1-4253458'
+        self.bank_name = BANK_NAME
+        self.contents = CONTENTS
+        self.signature = SIGNATURE
+        rng = random.Random(2014)
+        names = ['a', 'b', 'B', u'\u00e9', 'lIl', 'Ill', '']
+        # Repeated Section and Key names exercise the stable ordering.
+        self.bank = [Section(rng.choice(names),
+                             [Key(rng.choice(names), 'int',
+                                  str(rng.randint(0, 9)))
+                              for _ in range(rng.randint(0, 6))])
+                     for _ in range(40)]
+
+    def bank_file(self):
+        # Write the Sections in document order, unlike sc2bank.write().
+        xml = ['<Bank version="1">']
+        for section in self.bank:
+            xml.append(u'<Section name="{0}">'.format(section.name))
+            for key in section.keys:
+                xml.append(u'<Key name="{0}"><Value {1}="{2}"/></Key>'
+                           .format(key.name, key.type, key.value))
+            xml.append('</Section>')
+        xml.append('</Bank>')
+        return BytesIO(u''.join(xml).encode('UTF-8'))
+
+    def test_sign_file(self):
+        self.assertEquals(sign_file(StringIO(self.contents),
+                                    self.author_id,
+                                    self.user_id,
+                                    self.bank_name,
+                                    memory_budget=1),
+                          (self.signature, self.signature))
+
+    def test_matches_sign(self):
+        expected = sign(self.author_id, self.user_id, self.bank_name,
+                        self.bank)
+        for budget, max_runs in [(10 ** 9, 64), (1, 64),
+                                 (RECORD_OVERHEAD * 5, 64),
+                                 (RECORD_OVERHEAD * 5, 2)]:
+            self.assertEquals(sign_file(self.bank_file(),
+                                        self.author_id,
+                                        self.user_id,
+                                        self.bank_name,
+                                        memory_budget=budget,
+                                        max_runs=max_runs),
+                              (expected, None))
+        buf = BytesIO()
+        write(buf, self.bank, self.author_id, self.user_id, self.bank_name)
+        buf.seek(0)
+        self.assertEquals(sign_file(buf, self.author_id, self.user_id,
+                                    self.bank_name, memory_budget=1),
+                          (expected, expected))
+
+    def test_spill(self):
+        writer = _RunWriter(RECORD_OVERHEAD * 5, 3, None)
+        writer.parse(self.bank_file())
+        self.assertTrue(len(writer.records) < 5)
+        # With two runs merged at a time, each level holds at most one run.
+        levels = [level for level, _ in writer.runs]
+        self.assertTrue(levels)
+        self.assertEquals(levels, sorted(set(levels), reverse=True))
+        self.assertTrue(max(levels) > 1)
+        records = list(writer.sorted_records())
+        self.assertEquals(records, sorted(records))
+        self.assertEquals(len(records),
+                          len(self.bank) + sum(len(s.keys) for s in self.bank))
+
+
+if __name__ == '__main__':
+    unittest.main()
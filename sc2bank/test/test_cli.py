@@ -1,4 +1,5 @@
-from ..cli import main, parse_args
+from ..cli import main, parse_args, parse_command_args, parse_size, verify
+from mock import patch
 import unittest
 
 
@@ -28,6 +29,67 @@ class Test(unittest.TestCase):
             self.assertEquals(args.authorid, self.valid_authorid)
             self.assertEquals(args.bankname, self.valid_bankname)
 
+    def test_memory_budget(self):
+        args, _ = parse_args(['-m', '512M', self.valid_file])
+        self.assertEquals(args.memory_budget, 512 * 1024 * 1024)
+        args, _ = parse_args([self.valid_file])
+        self.assertEquals(args.memory_budget, None)
+        self.assertEquals(parse_size('4096'), 4096)
+        self.assertEquals(parse_size('2k'), 2048)
+        for bogus in ['', 'M', '0', '1.5G', '-1']:
+            self.assertRaises(ValueError, parse_size, bogus)
+
+    def test_main_fast_path(self):
+        with patch('sc2bank.cli.verify') as mock_verify:
+            with patch('sc2bank.cli.parse_args') as mock_parse_args:
+                main([self.valid_file])
+                mock_verify.assert_called_once_with(self.valid_file)
+                self.assertFalse(mock_parse_args.called)
+
+    def test_verify_memory_budget(self):
+        for budget, signer in [(None, 'sc2bank.sc2bank.sign_file'),
+                               (1024, 'sc2bank.bounded.sign_file')]:
+            with patch(signer) as mock_sign_file:
+                with patch('sys.stdin') as mock_stdin:
+                    mock_sign_file.return_value = ('ABC', 'ABC')
+                    verify('-', self.valid_authorid, self.valid_userid,
+                           self.valid_bankname, budget)
+                    kwargs = dict(author_id=self.valid_authorid,
+                                  user_id=self.valid_userid,
+                                  name=self.valid_bankname)
+                    if budget is not None:
+                        kwargs['memory_budget'] = budget
+                    mock_sign_file.assert_called_once_with(mock_stdin,
+                                                           **kwargs)
+
+    def test_parse_command_args(self):
+        args, _ = parse_command_args(['plan', 'work', 'banks.txt', '-s', '7'])
+        self.assertEquals((args.workdir, args.banks, args.shard_size),
+                          ('work', 'banks.txt', 7))
+        args, _ = parse_command_args(['worker', 'work',
+                                      '--lease-timeout', '30'])
+        self.assertEquals(args.lease_timeout, 30.0)
+        args, _ = parse_command_args(['merge', 'work', '-o', 'all.json'])
+        self.assertEquals(args.output, 'all.json')
+        args, _ = parse_command_args(['resign', 'banks.txt', '-j', 'j',
+                                      '-a', self.valid_authorid])
+        self.assertEquals((args.banks, args.journal, args.authorid),
+                          ('banks.txt', 'j', self.valid_authorid))
+        args, _ = parse_command_args(['resign', '-j', 'j', '--rollback'])
+        self.assertTrue(args.rollback)
+        self.assertFalse(args.resume)
+        args, _ = parse_command_args(['archive', 'banks.zip',
+                                      '--processes', '4'])
+        self.assertEquals((args.archive, args.processes), ('banks.zip', 4))
+        args, _ = parse_command_args(['recover', self.valid_file,
+                                      '--tree', 'Accounts',
+                                      '--range', '1-S2-1-4253000:4253999',
+                                      '--range', '1-S2-1-4337000:4337999',
+                                      '-b', self.valid_bankname])
+        self.assertEquals(args.tree, ['Accounts'])
+        self.assertEquals(len(args.range), 2)
+        self.assertEquals(args.bankname, [self.valid_bankname])
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
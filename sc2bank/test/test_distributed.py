@@ -0,0 +1,135 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from ..distributed import plan, shard_ids, read_shard, claim, work, merge, \
+    result_path, _lease_generations, LEASES_DIR
+from . import make_banks, BANK_NAME
+import unittest
+
+
+def _work(workdir, worker_id, queue):
+    queue.put(work(workdir, worker_id=worker_id, timeout=5.0,
+                   poll_interval=0.05))
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.workdir = os.path.join(self.tmp, 'work')
+        # Only the bank named in the signature verifies; the others are
+        # recorded as mismatches.
+        self.paths = make_banks(self.tmp, [BANK_NAME] +
+                                ['bank{0}'.format(i) for i in range(1, 20)])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_plan(self):
+        self.assertEquals(plan(self.workdir, self.paths, 3), 7)
+        shards = shard_ids(self.workdir)
+        self.assertEquals(len(shards), 7)
+        self.assertEquals(sum((read_shard(self.workdir, s) for s in shards),
+                              []),
+                          self.paths)
+        self.assertRaises(RuntimeError, plan, self.workdir, self.paths)
+
+    def test_plan_in_progress(self):
+        workdir = os.path.join(self.tmp, 'other')
+
+        def paths():
+            for i, path in enumerate(self.paths):
+                if i == len(self.paths) - 1:
+                    # Shards written so far must not be visible yet.
+                    self.assertRaises(RuntimeError, shard_ids, workdir)
+                yield path
+
+        self.assertEquals(plan(workdir, paths(), 3), 7)
+        self.assertEquals(len(shard_ids(workdir)), 7)
+        self.assertEquals(sorted(os.listdir(workdir)),
+                          ['leases', 'results', 'shards'])
+
+    def test_unplanned(self):
+        self.assertRaises(RuntimeError, work, self.workdir, 'w')
+        self.assertRaises(RuntimeError, merge, self.workdir)
+
+    def test_work_and_merge(self):
+        plan(self.workdir, self.paths, 6)
+        self.assertRaises(RuntimeError, merge, self.workdir)
+        self.assertEquals(work(self.workdir, 'w'), shard_ids(self.workdir))
+        results = merge(self.workdir)
+        self.assertEquals([r['path'] for r in results], self.paths)
+        self.assertEquals([r['ok'] for r in results],
+                          [True] + [False] * 19)
+        self.assertEquals(os.listdir(os.path.join(self.workdir, LEASES_DIR)),
+                          [])
+
+    def test_several_processes(self):
+        plan(self.workdir, self.paths, 1)
+        queue = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=_work,
+                                           args=(self.workdir, str(i), queue))
+                   for i in range(4)]
+        for p in workers:
+            p.start()
+        done = [queue.get(timeout=30) for _ in workers]
+        for p in workers:
+            p.join()
+        shards = sum(done, [])
+        self.assertEquals(sorted(shards), shard_ids(self.workdir))
+        self.assertEquals(len(merge(self.workdir)), len(self.paths))
+
+    def test_claim(self):
+        plan(self.workdir, self.paths, 10)
+        shard = shard_ids(self.workdir)[0]
+        lease = claim(self.workdir, shard, {}, 'a', 5.0)
+        self.assertTrue(lease.held())
+        # Generation 0 is taken and its lease is alive.
+        self.assertEquals(claim(self.workdir, shard, {}, 'b', 5.0), None)
+        generations = _lease_generations(self.workdir)
+        self.assertEquals(claim(self.workdir, shard, generations, 'b', 5.0),
+                          None)
+        lease.release()
+
+    def test_claim_ignores_clock_skew(self):
+        plan(self.workdir, self.paths, 10)
+        shard = shard_ids(self.workdir)[0]
+        lease = claim(self.workdir, shard, {}, 'a', 0.1)
+        lease.release()
+        # A lease file whose mtime is far behind this node's clock, as if
+        # set by a skewed NFS server, is not expired on first sight.
+        lease = os.path.join(self.workdir, LEASES_DIR, shard + '.1')
+        with open(lease, 'w') as f:
+            f.write('alive')
+        old = time.time() - 3600
+        os.utime(lease, (old, old))
+        generations, observed = _lease_generations(self.workdir), {}
+        self.assertEquals(claim(self.workdir, shard, generations, 'b', 0.1,
+                                observed), None)
+        # Only once its mtime stayed unchanged for the timeout.
+        time.sleep(0.2)
+        taken = claim(self.workdir, shard, generations, 'b', 0.1, observed)
+        self.assertEquals(taken.generation, 2)
+        taken.release()
+
+    def test_takeover_of_expired_lease(self):
+        plan(self.workdir, self.paths, 10)
+        crashed, other = shard_ids(self.workdir)
+        # Simulate a worker that crashed an hour ago while holding a lease.
+        stale = os.path.join(self.workdir, LEASES_DIR, crashed + '.0')
+        with open(stale, 'w') as f:
+            f.write('crashed')
+        old = time.time() - 3600
+        os.utime(stale, (old, old))
+        # The free shard is done first; the stale lease is taken over once
+        # its mtime has stayed unchanged for the timeout.
+        self.assertEquals(work(self.workdir, 'w', timeout=0.2,
+                               poll_interval=0.05),
+                          [other, crashed])
+        self.assertTrue(os.path.exists(result_path(self.workdir, crashed)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+from ..recover import id_range, ids_from_file, ids_from_tree, recover, \
+    recover_file
+from ..sc2bank import Section, Key, PathInfo
+import unittest
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.author_id = '1-S2-1-4337146'
+        self.user_id = '1-S2-1-4253458'
+        self.bank_name = 'llIlIIlIlIllIllI'
+        self.bank = [
+            Section('lllllIIlIllIIllI', [
+                Key('lllllllIlIllIIII', 'int', '5')
+            ]),
+            Section('IIlIlIIlllIIII', [
+                Key('IllIIIIIlIIIII', 'int', '780000')
+            ])
+        ]
+        self.signature = '3ECC1CCD9762908DE09D322235D5ED4D13CD1C53'
+        self.found = PathInfo(self.author_id, self.user_id, self.bank_name)
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_id_range(self):
+        self.assertEquals(id_range('1-S2-1-0999999:1000001'),
+                          ['1-S2-1-0999999', '1-S2-1-1000000',
+                           '1-S2-1-1000001'])
+        self.assertRaises(ValueError, id_range, '1-S2-1-4337146')
+
+    def test_ids_from_file_and_tree(self):
+        fname = os.path.join(self.tmp, 'ids.txt')
+        with open(fname, 'w') as f:
+            f.write('1-s2-1-4337146\n\n1-S2-1-4253458\n')
+        self.assertEquals(ids_from_file(fname),
+                          [self.author_id, self.user_id])
+        os.makedirs(os.path.join(self.tmp, 'Accounts', '12345678',
+                                 self.user_id, 'Banks', self.author_id))
+        self.assertEquals(ids_from_tree(self.tmp),
+                          [self.user_id, self.author_id])
+
+    def test_recover(self):
+        candidates = id_range('1-S2-1-4253400:4253500') + [self.author_id]
+        for processes in (1, 2):
+            self.assertEquals(recover(self.bank, self.signature,
+                                      candidates, candidates,
+                                      ['other', self.bank_name],
+                                      processes=processes, chunk_size=100),
+                              self.found)
+        self.assertEquals(recover(self.bank, self.signature,
+                                  [self.user_id], [self.author_id],
+                                  [self.bank_name], processes=1),
+                          None)
+
+    def test_recover_file(self):
+        for suffix in ('.SC2Bank', '.xml'):
+            fname = os.path.join(self.tmp, self.bank_name + suffix)
+            with open(fname, 'w') as f:
+                f.write('<Bank><Section name="lllllIIlIllIIllI">'
+                        '<Key name="lllllllIlIllIIII"><Value int="5"/></Key>'
+                        '</Section><Section name="IIlIlIIlllIIII">'
+                        '<Key name="IllIIIIIlIIIII"><Value int="780000"/>'
+                        '</Key></Section><Signature value="{0}"/></Bank>'
+                        .format(self.signature))
+            for processes in (1, 2):
+                self.assertEquals(recover_file(fname, [self.author_id],
+                                               [self.user_id],
+                                               processes=processes),
+                                  self.found)
+
+    def test_invalid_signature(self):
+        for signature in ('XYZ', 'ABC', self.signature[:-2]):
+            self.assertRaises(RuntimeError, recover, self.bank, signature,
+                              [self.author_id], [self.user_id],
+                              [self.bank_name], processes=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+from ..resign import replace_signature, swap_signature, Journal, resign, \
+    resume, rollback
+from ..sc2bank import sign_file
+from . import make_banks, CONTENTS, SIGNATURE, BANK_NAME
+import unittest
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.journal = os.path.join(self.tmp, 'resign.journal')
+        self.new_author_id = '1-S2-1-7654321'
+        self.old_signature = SIGNATURE
+        self.paths = make_banks(self.tmp, [BANK_NAME] +
+                                ['bank{0}'.format(i) for i in range(9)])
+        self.path = self.paths[0]
+        self.new_signature = sign_file(self.path,
+                                       author_id=self.new_author_id)[0]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def recorded(self, path):
+        return sign_file(path, author_id=self.new_author_id)
+
+    def test_replace_signature(self):
+        contents = CONTENTS.encode('UTF-8')
+        rewritten = replace_signature(contents, self.old_signature, 'ABC')
+        self.assertEquals(rewritten,
+                          contents.replace(self.old_signature.encode('UTF-8'),
+                                           b'ABC'))
+        self.assertEquals(replace_signature(rewritten, self.old_signature,
+                                            'ABC'),
+                          None)
+        self.assertRaises(RuntimeError, replace_signature, contents, 'DEF',
+                          'ABC')
+
+    def test_swap_signature(self):
+        self.assertTrue(swap_signature(self.path, self.old_signature,
+                                       self.new_signature))
+        self.assertFalse(swap_signature(self.path, self.old_signature,
+                                        self.new_signature))
+        self.assertEquals(self.recorded(self.path),
+                          (self.new_signature, self.new_signature))
+
+    def test_resign_and_rollback(self):
+        self.assertEquals(resign(self.paths, self.journal,
+                                 author_id=self.new_author_id,
+                                 processes=2, batch_size=3),
+                          (len(self.paths), {}))
+        for path in self.paths:
+            signature, recorded = self.recorded(path)
+            self.assertEquals(signature, recorded)
+        _, planned, done, failed = Journal(self.journal).load()
+        self.assertEquals(set(planned), set(self.paths))
+        self.assertEquals(done, set(self.paths))
+        self.assertEquals(failed, {})
+        self.assertRaises(RuntimeError, resign, self.paths, self.journal)
+
+        self.assertEquals(rollback(self.journal), (len(self.paths), {}))
+        self.assertEquals(sign_file(self.path),
+                          (self.old_signature, self.old_signature))
+        self.assertRaises(RuntimeError, resume, self.journal)
+
+    def test_resume(self):
+        # Simulate a run interrupted after planning, but before rewriting,
+        # the first bank.
+        journal = Journal(self.journal)
+        journal.create(self.paths, author_id=self.new_author_id)
+        journal.plan([(self.path, self.old_signature, self.new_signature)])
+        self.assertEquals(resume(self.journal, processes=2),
+                          (len(self.paths), {}))
+        self.assertEquals(resume(self.journal), (0, {}))
+        self.assertEquals(self.recorded(self.path),
+                          (self.new_signature, self.new_signature))
+
+    def test_bad_banks(self):
+        banks = os.path.dirname(self.path)
+        unsigned = os.path.join(banks, 'unsigned.SC2Bank')
+        with open(unsigned, 'w') as f:
+            f.write(CONTENTS.replace(
+                '<Signature value="{0}"/>'.format(self.old_signature), ''))
+        malformed = os.path.join(banks, 'malformed.SC2Bank')
+        with open(malformed, 'w') as f:
+            f.write(CONTENTS[:100])
+        missing = os.path.join(banks, 'missing.SC2Bank')
+        bad = [unsigned, malformed, missing]
+        count, failed = resign(self.paths[:2] + bad + self.paths[2:],
+                               self.journal, author_id=self.new_author_id,
+                               processes=2, batch_size=4)
+        self.assertEquals(count, len(self.paths))
+        self.assertEquals(sorted(failed), sorted(bad))
+        self.assertTrue(failed[unsigned].startswith('RuntimeError'))
+        self.assertTrue(failed[malformed].startswith('ParseError'))
+        for path in self.paths:
+            signature, recorded = self.recorded(path)
+            self.assertEquals(signature, recorded)
+        # The failed banks are skipped on resume and left alone on rollback.
+        self.assertEquals(resume(self.journal), (0, failed))
+        self.assertEquals(rollback(self.journal), (len(self.paths), {}))
+
+    def test_torn_journal(self):
+        # Simulate a run interrupted while appending its first plan record.
+        journal = Journal(self.journal)
+        journal.create(self.paths, author_id=self.new_author_id)
+        with open(self.journal, 'a') as f:
+            f.write('{"new": "AB')
+        self.assertEquals(resume(self.journal, batch_size=4),
+                          (len(self.paths), {}))
+        _, planned, done, _ = journal.load()
+        self.assertEquals(set(planned), set(self.paths))
+        self.assertEquals(done, set(self.paths))
+        self.assertEquals(rollback(self.journal), (len(self.paths), {}))
+        for path in self.paths:
+            self.assertEquals(sign_file(path)[1], self.old_signature)
+
+    def test_rollback_failure(self):
+        resign(self.paths, self.journal, author_id=self.new_author_id,
+               batch_size=2)
+        os.remove(self.path)
+        rewritten, failed = rollback(self.journal, batch_size=2)
+        self.assertEquals(rewritten, len(self.paths) - 1)
+        self.assertEquals(list(failed), [self.path])
+        for path in self.paths[1:]:
+            self.assertEquals(sign_file(path)[1], self.old_signature)
+        # A later rollback tries the failed bank again.
+        with open(self.path, 'w') as f:
+            f.write(CONTENTS.replace(self.old_signature,
+                                     self.new_signature))
+        self.assertEquals(rollback(self.journal), (1, {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import os
 from ..sc2bank import Section, Key, inspect_path, sign, sign_file, \
-    sign_string, parse, parse_string, safe_list_get, PathInfo
+    sign_string, parse, parse_string, safe_list_get, PathInfo, \
+    canonical_body, write, write_string, is_id
+from io import BytesIO
 try:
     from StringIO import StringIO
 except ImportError:
@@ -50,6 +52,13 @@ class Test(unittest.TestCase):
         self.assertEquals(inspect_path(os.sep.join(minimal_path)), correct)
         self.assertEquals(inspect_path(''), (None, None, None))
 
+    def test_is_id(self):
+        for id_ in ['1-S2-1-123456', '2-S2-1-1234567']:
+            self.assertTrue(is_id(id_))
+        for bogus in ['', '1-s2-1-123456', '1-S2-1-12345', '1-S2-1-12345678',
+                      '1-S2-1-12345a', '12-S2-1-123456', '1-S2-1-123456-1']:
+            self.assertFalse(is_id(bogus))
+
     def test_sign(self):
         self.assertEquals(sign(self.author_id,
                                self.user_id,
@@ -82,6 +91,9 @@ class Test(unittest.TestCase):
                             Key('TestKey', 'int', '5')
                             ])],
                            None))
+        self.assertRaises(SyntaxError, parse, StringIO('<Bank><Section'))
+        self.assertRaises(RuntimeError, parse, StringIO(
+            '<Bank><Section name="a"><Key name="b"/></Section></Bank>'))
 
     def test_parse_string(self):
         self.assertEquals(parse_string(self.contents),
@@ -125,6 +137,31 @@ class Test(unittest.TestCase):
                                       self.bank_name),
                           (self.signature, self.signature))
 
+    def test_canonical_body(self):
+        self.assertEquals(canonical_body(self.bank),
+                          b'IIlIlIIlllIIIIIllIIIIIlIIIIIValueint780000'
+                          b'lllllIIlIllIIllIlllllllIlIllIIIIValueint5')
+
+    def test_write(self):
+        contents, signature = write_string(self.bank,
+                                           self.author_id,
+                                           self.user_id,
+                                           self.bank_name)
+        self.assertEquals(signature, self.signature)
+        self.assertEquals(parse_string(contents),
+                          (sorted(self.bank), self.signature))
+        buf = BytesIO()
+        self.assertEquals(write(buf, self.bank, self.author_id, self.user_id,
+                                self.bank_name, chunk_size=1),
+                          self.signature)
+        self.assertEquals(buf.getvalue().decode('UTF-8'), contents)
+        bank = [Section('<&"\'>', [Key('a"b', 'string', u'\u00e9<&>"\'')])]
+        contents, signature = write_string(bank, self.author_id,
+                                           self.user_id, self.bank_name)
+        self.assertEquals(parse_string(contents), (bank, signature))
+        self.assertEquals(signature, sign(self.author_id, self.user_id,
+                                          self.bank_name, bank))
+
 
 if __name__ == '__main__':
     unittest.main()
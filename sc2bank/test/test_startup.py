@@ -0,0 +1,83 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from . import make_banks
+import unittest
+
+
+# Imported by the batch commands but not needed to verify one SC2Bank.
+HEAVY_MODULES = ['argparse', 'json', 'multiprocessing', 'tarfile',
+                 'xml.etree.ElementTree', 'xml.sax.saxutils', 're']
+
+RUNS = 5
+
+
+def import_times(args, pycache):
+    """
+    Run python -X importtime with args, caching bytecode in pycache.
+
+    Returns:
+    Dictionary mapping each imported module to its own import time in
+    microseconds.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime',
+         '-X', 'pycache_prefix=' + pycache] + args,
+        stderr=subprocess.STDOUT, cwd=root, env=env).decode('UTF-8')
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, _, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(own)
+    return times
+
+
+def startup_cost(args, baseline, pycache):
+    """Median import time of the modules baseline does not import."""
+    import_times(args, pycache)  # Warm up the bytecode cache.
+    costs = sorted(sum(t for m, t in import_times(args, pycache).items()
+                       if m not in baseline)
+                   for _ in range(RUNS))
+    return costs[RUNS // 2]
+
+
+@unittest.skipIf(sys.version_info < (3, 8),
+                 '-X importtime and pycache_prefix need Python 3.8')
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.bank, = make_banks(self.tmp)
+        self.pycache = os.path.join(self.tmp, 'pycache')
+        # Running a module imports runpy and its dependencies regardless.
+        self.baseline = import_times(['-c', 'import runpy, importlib.util'],
+                                     self.pycache)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_verify_imports(self):
+        imported = import_times(['-m', 'sc2bank', self.bank], self.pycache)
+        heavy = [m for m in HEAVY_MODULES
+                 if m in imported and m not in self.baseline]
+        self.assertEquals(heavy, [])
+
+    def test_verify_startup(self):
+        # Verifying a SC2Bank must cost less to import than ElementTree
+        # alone did before the verify path stopped importing it.
+        verify = startup_cost(['-m', 'sc2bank', self.bank], self.baseline,
+                              self.pycache)
+        threshold = startup_cost(['-c', 'import xml.etree.ElementTree'],
+                                 self.baseline, self.pycache)
+        self.assertLess(verify, threshold)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,6 +26,7 @@ setup(
     author_email='sc2bank@fastmail.fm',
     license='MIT / BSD 3-clause',
     packages=['sc2bank', 'sc2bank.test'],
+    extras_require={'zstd': ['zstandard']},
     tests_require='mock',
     test_suite='sc2bank.test',
 )